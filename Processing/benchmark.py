@@ -0,0 +1,182 @@
+import os
+import sys
+import io
+import json
+import time
+import platform
+import contextlib
+import numpy as np
+import pandas as pd
+import cv2
+import argparse
+import helpers as h
+import synthetic as syn
+import roi_cache as rc
+from classes import Trial, Transformer
+from calibrate import calibrate_trial
+from estimate import estimate_positions
+
+# ------------------------------------------------------------
+# BENCHMARKS: Time the calibration and estimation pipeline on synthetic recordings.
+# Runs fully offline by swapping easyocr for `synthetic.GlyphOCR`, and skips the interactive
+# ROI selection by passing the known counter bounding box. Results are written as JSON and can
+# be compared against a previous run to detect regressions.
+# ------------------------------------------------------------
+
+# === Run a callable `repeat` times, returning the elapsed seconds of each run ===
+def time_runs(fn, repeat:int=3, quiet:bool=True):
+    seconds = []
+    for _ in range(repeat):
+        sink = io.StringIO()
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                stack.enter_context(contextlib.redirect_stdout(sink))
+                stack.enter_context(contextlib.redirect_stderr(sink))
+            start = time.perf_counter()
+            fn()
+            seconds.append(time.perf_counter() - start)
+    return seconds
+
+# === Summarize timings. `units` is the amount of work per run (frames, points), for throughput ===
+def summarize(seconds, units:int, unit_name:str):
+    median = float(np.median(seconds))
+    return {
+        'seconds': seconds,
+        'median': median,
+        'min': float(np.min(seconds)),
+        'units': units,
+        'unit': unit_name,
+        'throughput': units / median if median > 0 else None,
+    }
+
+# === Benchmark every pipeline stage on one synthetic device recording ===
+def benchmark_device(root_dir:str, resolution, anchor_filepath:str, repeat:int=3, cube_duration:float=5.0, verbose:bool=True):
+    results = {}
+    manifest = syn.generate_recording(root_dir, resolution, anchor_filepath, cube_duration=cube_duration, verbose=verbose)
+    bbox_min, bbox_max = manifest['bbox_min'], manifest['bbox_max']
+    quiet = not verbose
+
+    # Full calibration, including validation images
+    # Named 'trial' so that saving it does not overwrite the recording's `synthetic.json` manifest
+    trial = Trial(root_dir=root_dir, trial_name='trial')
+    seconds = time_runs(lambda: calibrate_trial(trial, anchor_filepath, manifest['video_filename'], manifest['targets_filename'],
+                                                bbox_min=bbox_min, bbox_max=bbox_max, verbose=verbose), repeat=repeat, quiet=quiet)
+    results['calibrate_trial'] = summarize(seconds, len(syn.TARGET_OFFSETS), 'targets')
+    # Accuracy check: mean pixel distance between fitted and ground-truth projections of the targets
+    truth = np.array(manifest['transform'])
+    points = np.array([[syn.VR_SCREEN_SIZE[0]/2+dx, syn.VR_SCREEN_SIZE[1]/2+dy, 1] for dx, dy in syn.TARGET_OFFSETS])
+    results['calibrate_trial']['reprojection_error'] = float(np.linalg.norm(points @ np.array(trial.transformer.transform) - points @ truth, axis=1).mean())
+
+    # Same calibration, keeping only crops around each target
+    low_memory_trial = Trial(root_dir=root_dir, trial_name='trial')
+    seconds = time_runs(lambda: calibrate_trial(low_memory_trial, anchor_filepath, manifest['video_filename'], manifest['targets_filename'],
+                                                bbox_min=bbox_min, bbox_max=bbox_max, low_memory=True, verbose=verbose), repeat=repeat, quiet=quiet)
+    results['calibrate_trial_low_memory'] = summarize(seconds, len(syn.TARGET_OFFSETS), 'targets')
+
+    # Full estimation over the whole recording
+    seconds = time_runs(lambda: estimate_positions(trial, manifest['positions_filename'], manifest['video_filename'],
+                                                   bbox_min=bbox_min, bbox_max=bbox_max, verbose=verbose), repeat=repeat, quiet=quiet)
+    results['estimate_positions'] = summarize(seconds, manifest['frames'], 'frames')
+
+    # OCR timeline rebuilt from a memory-mapped ROI cache, without decoding the video
+    cache = rc.build_roi_cache(os.path.join(root_dir, manifest['video_filename']), bbox_min=bbox_min, bbox_max=bbox_max, verbose=False)
+    seconds = time_runs(lambda: cache.timeline(), repeat=repeat, quiet=quiet)
+    results['roi_cache_timeline'] = summarize(seconds, cache.frames, 'frames')
+
+    # Template matching on a single full-resolution frame with one anchor
+    anchor = cv2.imread(anchor_filepath, cv2.IMREAD_UNCHANGED)
+    target = cv2.resize(anchor, (40, 40), interpolation=cv2.INTER_NEAREST)
+    center = np.dot([syn.VR_SCREEN_SIZE[0]/2, syn.VR_SCREEN_SIZE[1]/2, 1], truth)
+    frame = syn.render_frame(resolution, 0, anchor=target, anchor_coords=center)
+    seconds = time_runs(lambda: h.estimate_template_from_image(frame, anchor, verbose=False), repeat=repeat, quiet=quiet)
+    results['estimate_template_from_image'] = summarize(seconds, 1, 'frames')
+
+    # Projection of every cube position through the fitted Transformer
+    pdf = pd.read_csv(os.path.join(root_dir, manifest['positions_filename']))
+    positions = list(zip(pdf['left_screen_pos_x'].tolist(), pdf['left_screen_pos_y'].tolist()))
+    transformer = Transformer(obj={'name':'transformer', 'transform':trial.transformer.transform})
+    seconds = time_runs(lambda: [transformer.screen_to_frame(p) for p in positions], repeat=repeat, quiet=quiet)
+    results['transformer_projection'] = summarize(seconds, len(positions), 'points')
+    return results
+
+# === Compare a benchmark output against a baseline. Returns a list of regressions ===
+#   A regression is any benchmark whose median is more than `tolerance` slower than the baseline.
+def compare(current, baseline, tolerance:float=0.25):
+    regressions = []
+    for device, benches in current['results'].items():
+        if device not in baseline['results']: continue
+        for bench, stats in benches.items():
+            if bench not in baseline['results'][device]: continue
+            ratio = stats['median'] / baseline['results'][device][bench]['median']
+            stats['baseline_ratio'] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append({'device':device, 'benchmark':bench, 'ratio':ratio})
+    return regressions
+
+# === Run the suite over multiple devices, outputting a machine-readable baseline ===
+def run_benchmarks(output_dir:str,
+                   devices=None,
+                   resolutions=None,
+                   anchor_filepath:str='./anchor.png',
+                   repeat:int=3,
+                   cube_duration:float=5.0,
+                   verbose:bool=False):
+    if resolutions is None:
+        resolutions = {d: syn.DEVICES[d] for d in (devices if devices is not None else syn.DEVICES.keys())}
+    previous_reader = h.reader
+    h.set_ocr_reader(syn.GlyphOCR())
+    output = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'pandas': pd.__version__,
+            'repeat': repeat,
+            'cube_duration': cube_duration,
+        },
+        'results': {}
+    }
+    try:
+        for name, resolution in resolutions.items():
+            print(f"Benchmarking '{name}' ({resolution[0]}x{resolution[1]})...")
+            output['results'][name] = benchmark_device(os.path.join(output_dir, name), resolution, anchor_filepath,
+                                                       repeat=repeat, cube_duration=cube_duration, verbose=verbose)
+            for bench, stats in output['results'][name].items():
+                print(f"\t{bench}: {stats['median']:.4f}s median, {stats['throughput']:.1f} {stats['unit']}/s")
+    finally:
+        h.set_ocr_reader(previous_reader)
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-od', '--output_dir', help="Directory for the synthetic recordings", type=str, default='./benchmarks')
+    parser.add_argument('-o', '--output', help="Filepath of the JSON results", type=str, default='./benchmarks/benchmark.json')
+    parser.add_argument('-d', '--devices', help="Devices to benchmark", nargs='+', choices=list(syn.DEVICES.keys()), default=None)
+    parser.add_argument('-r', '--resolutions', help="Custom resolutions as WIDTHxHEIGHT, overrides --devices", nargs='+', default=None)
+    parser.add_argument('-n', '--repeat', help="Number of timed runs per benchmark", type=int, default=3)
+    parser.add_argument('-cd', '--cube_duration', help="Seconds of cube movement in each recording", type=float, default=5.0)
+    parser.add_argument('-b', '--baseline', help="Previous JSON results to compare against", type=str, default=None)
+    parser.add_argument('-t', '--tolerance', help="Allowed slowdown relative to the baseline before flagging a regression", type=float, default=0.25)
+    parser.add_argument('-v', '--verbose', help="If set, will not silence pipeline output", action="store_true")
+    args = parser.parse_args()
+
+    resolutions = {r: tuple(int(v) for v in r.split('x')) for r in args.resolutions} if args.resolutions is not None else None
+    output = run_benchmarks(args.output_dir, devices=args.devices, resolutions=resolutions, repeat=args.repeat,
+                            cube_duration=args.cube_duration, verbose=args.verbose)
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(output, json.load(file), tolerance=args.tolerance)
+        output['regressions'] = regressions
+        for r in regressions:
+            print(f"\tRegression: '{r['benchmark']}' on '{r['device']}' is {r['ratio']:.2f}x the baseline")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as outfile:
+        json.dump(output, outfile, indent=2)
+    print(f"Results saved in '{args.output}'")
+    sys.exit(1 if len(regressions) > 0 else 0)
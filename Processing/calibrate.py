@@ -30,6 +30,10 @@ def calibrate_trial(trial:Trial,
                     vr_x_colname:str="left_screen_pos_x",
                     vr_y_colname:str="left_screen_pos_y",
                     video_time_threshold:float=35,
+                    bbox_min=None,
+                    bbox_max=None,
+                    low_memory:bool=False,
+                    crop_padding:int=50,
                     validate:bool=True,
                     verbose:bool=True):
         
@@ -61,8 +65,10 @@ def calibrate_trial(trial:Trial,
         
         fps = cap.get(cv2.CAP_PROP_FPS)
         frame_limit = int(video_time_threshold * fps)   # 45 seconds → frame index
-        bbox_min, bbox_max = ocr.frame_count_bounding_box(video_filepath) # bounding box for ocr
+        if bbox_min is None or bbox_max is None:
+            bbox_min, bbox_max = ocr.frame_count_bounding_box(video_filepath) # bounding box for ocr
         frames = []                             # Initialize collection of frames
+        anchor_img = cv2.imread(anchor_filepath, cv2.IMREAD_UNCHANGED)
         pbar.update(1)
         
         # Iterate through all frames
@@ -83,8 +89,13 @@ def calibrate_trial(trial:Trial,
                 # Confirm which target frame is associated with 
                 row = target_frames[target_frame_keys[target_number_index]]
                 vr_coords = (row[vr_x_colname], row[vr_y_colname])  # Get screen position in VR
-                frame = CFrame(row['target_number'], vr_coords=vr_coords)   # Create frame, cache it
-                frame.set_frame(_frame)
+                frame = CFrame(row['target_number'], vr_coords=vr_coords, frame_index=fidx)   # Create frame, cache it
+                if low_memory:
+                    # Match the anchor while the full frame is in hand, then only keep a padded crop around it
+                    frame.set_bboxes(h.estimate_template_from_image(_frame, anchor_img, verbose=verbose))
+                    frame.set_crop(_frame, padding=crop_padding)
+                else:
+                    frame.set_frame(_frame)
                 frames.append(frame)
                 target_number_index += 1
             # Once we've confirmed we've hit all the targets, we bail
@@ -101,11 +112,11 @@ def calibrate_trial(trial:Trial,
 
         # Template Search
         pbar.set_description(f"Template matching...")
-        anchor_img = cv2.imread(anchor_filepath, cv2.IMREAD_UNCHANGED)
         trial.transformer = Transformer(name="transformer") # Init transformer class
         for frame in frames:
-            # Calculate bounding boxes and their centroids
-            frame.set_bboxes(h.estimate_template_from_image(frame.frame, anchor_img, verbose=verbose))
+            # Calculate bounding boxes and their centroids, unless low-memory mode already did
+            if frame.bboxes is None:
+                frame.set_bboxes(h.estimate_template_from_image(frame.frame, anchor_img, verbose=verbose))
             _, median_center = frame.get_centroids()
             frame.img_coords = median_center
             # Append coords to transformer
@@ -127,15 +138,18 @@ def calibrate_trial(trial:Trial,
             pbar.set_description(f"Validating the transformation matrix...")
             validation_outdir = h.mkdirs(os.path.join(trial.root_dir, 'calibrations'))
             validation_errors = []
+            if low_memory: cap = cv2.VideoCapture(video_filepath)   # Full frames are re-fetched one at a time
             for frame in frames:
                 vr_coords = frame.vr_coords
                 img_coords = frame.img_coords
                 estimation = trial.transformer.screen_to_frame(frame.vr_coords)
-                outframe = frame.draw_marker(img_coords, color=[225,255,0], marker=cv2.MARKER_DIAMOND)
+                full_frame = frame.fetch_frame(cap) if low_memory else None
+                outframe = frame.draw_marker(img_coords, frame=full_frame, color=[225,255,0], marker=cv2.MARKER_DIAMOND)
                 outframe = frame.draw_marker(vr_coords, frame=outframe, color=[255,255,0], marker=cv2.MARKER_CROSS)
                 outframe = frame.draw_marker(estimation, frame=outframe, color=[0,0,0], marker=cv2.MARKER_TILTED_CROSS)
                 cv2.imwrite(os.path.join(validation_outdir, f"{frame.name}.jpg"), outframe)
                 validation_errors.append({'frame':frame.name, 'error': np.sqrt((estimation[0] - img_coords[0])**2 + (estimation[1] - img_coords[1])**2)})
+            if low_memory: cap.release()
             validation_df = pd.DataFrame(validation_errors)
             validation_df.to_csv(os.path.join(validation_outdir, 'calibration_errors.csv'), index=False)
             pbar.update(1)
@@ -150,6 +164,7 @@ if __name__ == '__main__':
     parser.add_argument('name', help="Trial name", type=str)
     parser.add_argument('-vf', '--video_filename', help="Fileame of the video file, including extension, relative to the trial dir", type=str, default="calibration.mp4")
     parser.add_argument('-tf', '--targets_filename', help="Filename of the targets csv file, including extension, relative to the trial dir", type=str, default="calibration.csv")
+    parser.add_argument('-lm', '--low_memory', help="If set, keeps only crops around each target instead of full frames", action="store_true")
     args = parser.parse_args()
 
     trial = Trial(
@@ -160,4 +175,5 @@ if __name__ == '__main__':
                     './anchor.png',
                     args.video_filename,
                     args.targets_filename,
+                    low_memory=args.low_memory,
                     verbose=False )
\ No newline at end of file
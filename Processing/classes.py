@@ -14,6 +14,7 @@ import helpers as h
 #       VR screen coordinates to frame coordinates.
 class Transformer:
     def __init__(self, name:str=None, vr_coords=None, img_coords=None, transform=None, json_src:str=None, obj:object=None):
+        self.json_src = json_src
         if json_src is not None:    self.load_json(json_src)
         elif obj is not None:       self.load_obj(obj)
         else:
@@ -30,6 +31,7 @@ class Transformer:
         self.img_coords = obj['img_coords'] if 'img_coords' in obj else None
         self.transform = obj['transform'] if 'transform' in obj else None
     def load_json(self, json_src:str):
+        self.json_src = json_src
         try: 
             with open(json_src, 'r') as file:
                 self.load_obj(json.load(file))
@@ -136,18 +138,55 @@ class Frame:
 # === Calibration Frame Subclass ===
 #   Inherited from parent `Frame` class. 
 #   Specifically for calibration frames, which expect bounding boxes.
+#   In low-memory mode, `frame` only holds a padded crop around the bounding boxes. `offset` is the
+#       top-left corner of that crop, so bboxes and centroids always stay in full-frame coordinates.
 class CFrame(Frame):
-    def __init__(self, name, vr_coords=None, img_coords=None, bboxes=None):
+    def __init__(self, name, vr_coords=None, img_coords=None, bboxes=None, frame_index:int=None):
         Frame.__init__(self, name)
+        self.frame = None
         self.vr_coords = vr_coords
         self.img_coords = img_coords
         self.bboxes = bboxes
+        self.frame_index = frame_index
+        self.offset = (0, 0)
 
     # Setters
     # ------------------------------------------
     def set_bboxes(self, bboxes):
         self.bboxes = bboxes
         return self
+    def set_crop(self, frame, padding:int=50):
+        assert self.bboxes is not None, "Cannot crop around bboxes that don't exist"
+        if len(self.bboxes) == 0:
+            self.frame, self.offset = None, (0, 0)
+            return self
+        height, width = frame.shape[:2]
+        x1 = max(0, int(min(b[0] for b in self.bboxes)) - padding)
+        y1 = max(0, int(min(b[1] for b in self.bboxes)) - padding)
+        x2 = min(width, int(max(b[2] for b in self.bboxes)) + padding)
+        y2 = min(height, int(max(b[3] for b in self.bboxes)) + padding)
+        self.frame = frame[y1:y2, x1:x2].copy()
+        self.offset = (x1, y1)
+        return self
+    
+    # Loaders
+    # ------------------------------------------
+    # Seeking with `CAP_PROP_POS_FRAMES` is not frame-accurate on real recordings, so the capture is only
+    #   ever moved forward. Frames must therefore be fetched in ascending `frame_index` order from one capture.
+    def fetch_frame(self, cap):
+        assert self.frame_index is not None, "Cannot fetch a frame without its frame index"
+        position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        assert position <= self.frame_index, f"Capture is already past frame w/ idx {self.frame_index} (at {position}); fetch frames in ascending order"
+        for _ in range(self.frame_index - position):
+            assert cap.grab(), f"Could not skip to frame w/ idx {self.frame_index}"
+        ok = cap.grab()
+        if ok: ok, frame = cap.retrieve()
+        assert ok, f"Could not re-read frame w/ idx {self.frame_index}"
+        # The stored crop must match the same region of the re-read frame
+        if self.frame is not None:
+            (x, y), (height, width) = self.offset, self.frame.shape[:2]
+            assert np.array_equal(frame[y:y+height, x:x+width], self.frame), f"Re-read frame w/ idx {self.frame_index} does not match its stored crop"
+        return frame
     
     # Getters
     # ------------------------------------------
@@ -159,25 +198,31 @@ class CFrame(Frame):
     
     # Applications
     # ------------------------------------------
+    # Coordinates are full-frame; shift them into the crop when drawing on the stored frame
+    def _local(self, coords, frame=None):
+        ox, oy = self.offset if frame is None else (0, 0)
+        return (int(coords[0]) - ox, int(coords[1]) - oy)
+    def draw_marker(self, coords, frame=None, color=[0,0,0], marker=cv2.MARKER_CROSS, inplace:bool=False):
+        return Frame.draw_marker(self, self._local(coords, frame), frame=frame, color=color, marker=marker, inplace=inplace)
     def draw_bboxes(self, frame=None, bbox_color=[0,255,255], bbox_thickness=1, draw_centroids:bool=True, centroids_color=[0,255,255]):
         assert self.bboxes is not None, "Cannot draw bboxes that don't exist"
         outframe = frame.copy() if frame is not None else self.frame.copy()
         for (x1, y1, x2, y2, cx, cy) in self.bboxes:
-            outframe = cv2.rectangle(outframe, (x1, y1), (x2, y2), bbox_color, bbox_thickness)
+            outframe = cv2.rectangle(outframe, self._local((x1, y1), frame), self._local((x2, y2), frame), bbox_color, bbox_thickness)
             if draw_centroids:
-                outframe = cv2.drawMarker(outframe, (int(cx), int(cy)), centroids_color, cv2.MARKER_CROSS, 20, 2)
+                outframe = cv2.drawMarker(outframe, self._local((cx, cy), frame), centroids_color, cv2.MARKER_CROSS, 20, 2)
         return outframe
     def draw_mean_centroid(self, frame=None, color=[255,255,0], marker=cv2.MARKER_CROSS):
         assert self.bboxes is not None, "Cannot draw mean centroid from bboxes that don't exist"
         outframe = frame.copy() if frame is not None else self.frame.copy()
         center = np.mean([[cx,cy] for (x1, y1, x2, y2, cx, cy) in self.bboxes], axis=0)
-        outframe = cv2.drawMarker(outframe, (int(center[0]), int(center[1])), color, marker, 20, 2)
+        outframe = cv2.drawMarker(outframe, self._local(center, frame), color, marker, 20, 2)
         return outframe
     def draw_median_centroid(self, frame=None, color=[0,0,0], marker=cv2.MARKER_TILTED_CROSS):
         assert self.bboxes is not None, "Cannot draw mean centroid from bboxes that don't exist"
         outframe = self.frame.copy() if frame is None else frame.copy()
         center = np.median([[cx,cy] for (x1, y1, x2, y2, cx, cy) in self.template_bboxes], axis=0)
-        outframe = cv2.drawMarker(outframe, (int(center[0]), int(center[1])), color, marker, 20, 2)
+        outframe = cv2.drawMarker(outframe, self._local(center, frame), color, marker, 20, 2)
         return outframe
     
 
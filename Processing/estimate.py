@@ -8,7 +8,7 @@ import argparse
 import warnings
 import helpers as h
 import ocr
-from classes import Trial, Frame
+from classes import Trial, Frame, Transformer
 
 pd.options.mode.chained_assignment = None  # default='warn'
 warnings.filterwarnings(
@@ -16,6 +16,74 @@ warnings.filterwarnings(
     message="'pin_memory' argument is set as true but not supported on MPS"
 )
 
+# Marker colors cycled through when projections don't set their own
+PROJECTION_COLORS = [[255,225,0], [0,225,255], [255,0,255], [0,255,0], [0,0,255], [255,255,255]]
+
+# === Label a Transformer for output column names, from least to most specific ===
+#   Level 0 is its name, level 1 the base name of its JSON file, level 2 that JSON's directory and base name.
+def transformer_label(transformer:Transformer, level:int=0):
+    if level == 0: return transformer.name
+    if transformer.json_src is None: return None
+    stem = os.path.splitext(os.path.basename(transformer.json_src))[0]
+    if level == 1: return stem
+    return f"{os.path.basename(os.path.dirname(os.path.abspath(transformer.json_src)))}_{stem}"
+
+# === Normalize a list of projections ===
+#   Each projection is a tuple (x_colname, y_colname, transformer[, color[, name]]). A transformer of None
+#   uses `default_transformer`. Without `projections`, a single projection writes to 'video_x'/'video_y' as before;
+#   otherwise each one writes to '<name>_video_x'/'<name>_video_y'. The name defaults to the x column without its
+#   '_x' suffix; when several projections share a column, each is also suffixed with a label of its Transformer.
+#   Example:
+#   projections = normalize_projections([('left_screen_pos_x', 'left_screen_pos_y', None), ('right_screen_pos_x', 'right_screen_pos_y', None)], trial.transformer)
+def normalize_projections(projections, default_transformer:Transformer=None, x_colname:str='left_screen_pos_x', y_colname:str='left_screen_pos_y'):
+    if projections is None:
+        assert default_transformer is not None, "The trial does not have a Transformer set; make sure to assign a Transformer first."
+        return [{'name':None, 'x_colname':x_colname, 'y_colname':y_colname, 'transform':np.array(default_transformer.transform),
+                 'color':PROJECTION_COLORS[0], 'columns':('video_x', 'video_y')}]
+
+    # Resolve transformers and default names
+    entries = []
+    for i, projection in enumerate(projections):
+        x_col, y_col, transformer = projection[:3]
+        if transformer is None: transformer = default_transformer
+        color = projection[3] if len(projection) > 3 and projection[3] is not None else PROJECTION_COLORS[i % len(PROJECTION_COLORS)]
+        explicit = projection[4] if len(projection) > 4 and projection[4] is not None else None
+        base = explicit if explicit is not None else (x_col[:-2] if x_col.endswith('_x') else x_col)
+        assert transformer is not None and transformer.transform is not None, f"Projection '{base}' does not have a Transformer with its transformation matrix set."
+        entries.append({'x_colname':x_col, 'y_colname':y_col, 'transformer':transformer, 'color':color, 'explicit':explicit is not None, 'name':base})
+
+    # Default names shared by several projections get the least specific Transformer label that tells them apart
+    for base in set(e['name'] for e in entries if not e['explicit']):
+        group = [e for e in entries if not e['explicit'] and e['name'] == base]
+        if len(group) < 2: continue
+        for level in range(3):
+            labels = [transformer_label(e['transformer'], level) for e in group]
+            if None not in labels and len(set(labels)) == len(labels):
+                for e, label in zip(group, labels): e['name'] = f"{base}_{label}"
+                break
+
+    # Anything still clashing falls back to the projection index
+    normalized, names = [], set()
+    for i, e in enumerate(entries):
+        name = e['name'] if e['name'] not in names else f"{e['name']}_{i}"
+        names.add(name)
+        normalized.append({'name':name, 'x_colname':e['x_colname'], 'y_colname':e['y_colname'], 'transform':np.array(e['transformer'].transform),
+                           'color':e['color'], 'columns':(f"{name}_video_x", f"{name}_video_y")})
+    return normalized
+
+# === Apply every projection to a positions dataframe, adding their output columns in place ===
+#   Returns the projected coordinates of each projection, in the same order.
+def apply_projections(df, projections):
+    ones = np.ones(len(df.index))
+    results = []
+    for p in projections:
+        coords = np.column_stack([df[p['x_colname']].to_numpy(dtype=float), df[p['y_colname']].to_numpy(dtype=float), ones])
+        projected = np.dot(coords, p['transform']).reshape(-1, 2)
+        df[p['columns'][0]] = projected[:,0]
+        df[p['columns'][1]] = projected[:,1]
+        results.append(projected)
+    return results
+
 
 def estimate_positions(trial:Trial, 
                        positions_filename:str, 
@@ -24,6 +92,10 @@ def estimate_positions(trial:Trial,
                        x_colname:str='left_screen_pos_x',
                        y_colname:str='left_screen_pos_y',
                        output_dirname:str='estimations',
+                       bbox_min=None,
+                       bbox_max=None,
+                       timeline:dict=None,
+                       projections=None,
                        output_video:bool=False,
                        preview:bool=False,
                        verbose:bool=True):
@@ -33,7 +105,7 @@ def estimate_positions(trial:Trial,
     video_filepath = os.path.join(trial.root_dir, video_filename)
     assert os.path.exists(positions_filepath), f"Anchor image '{positions_filepath}' does not exist."
     assert os.path.exists(video_filepath), f"Requested video '{video_filepath}' does not exist in the root directory."
-    assert trial.transformer is not None, "The trial does not have a Transformer set; make sure to assign a Transformer first."
+    projections = normalize_projections(projections, trial.transformer, x_colname=x_colname, y_colname=y_colname)
 
     # Create output directory
     outdir = h.mkdirs(os.path.join(trial.root_dir, output_dirname))
@@ -41,10 +113,24 @@ def estimate_positions(trial:Trial,
     # Extract positions dataframe, for reference later
     pdf = pd.read_csv(positions_filepath)
     pdf[frame_colname] = pdf[frame_colname].astype(int)
+    frame_lookup = pdf.groupby(frame_colname).indices  # VR frame -> row positions
 
     # Prepare video(s)
     cap = cv2.VideoCapture(video_filepath)  # Get a cpature window
     assert cap.isOpened(), f"Could not open video '{video_filename}'"
+
+    # A timeline that covers every frame of the video already holds all that decoding would tell us.
+    # Unless frames are drawn, project through it instead of decoding the video again.
+    if timeline is not None and not (output_video or preview):
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count > 0 and all(fidx in timeline for fidx in range(frame_count)):
+            cap.release()
+            if verbose: print("\tTimeline covers the whole video; skipping decoding")
+            rpdf = match_timeline(pdf, timeline, frame_colname=frame_colname)
+            apply_projections(rpdf, projections)
+            rpdf.to_csv(os.path.join(outdir, 'repositions.csv'), index=0)
+            return rpdf
+
     if output_video:
         output_video_basename, output_video_extension = os.path.splitext(video_filename)
         fps    = cap.get(cv2.CAP_PROP_FPS)
@@ -55,8 +141,9 @@ def estimate_positions(trial:Trial,
         output_video_filepath = os.path.join(outdir, output_video_basename+output_ext)
         out = cv2.VideoWriter(output_video_filepath, fourcc, fps, (width, height))
 
-    # Allow the user to select a bounding box for identifying frame counts in the video
-    bbox_min, bbox_max = ocr.frame_count_bounding_box(video_filepath)
+    # Allow the user to select a bounding box for identifying frame counts in the video, unless one was provided
+    if bbox_min is None or bbox_max is None:
+        bbox_min, bbox_max = ocr.frame_count_bounding_box(video_filepath)
     print("ROI coordinates:", bbox_min, bbox_max)
 
     # Iterate through video frames. Open preview window if we are previewing
@@ -74,28 +161,28 @@ def estimate_positions(trial:Trial,
         if output_video or preview:
             outframe = Frame(fidx)
             outframe.set_frame(frame.copy())
-        # Use OCR to interpret VR frame index from video frame
-        vr_frame_number, is_int = h.check_frame_number(frame, bbox_min, bbox_max, return_frames=False)
+        # Use OCR to interpret VR frame index from video frame, unless a previous pass already did
+        if timeline is not None and fidx in timeline:
+            vr_frame_number = timeline[fidx]
+            is_int = vr_frame_number is not None
+        else:
+            vr_frame_number, is_int = h.check_frame_number(frame, bbox_min, bbox_max, return_frames=False)
+            if timeline is not None: timeline[fidx] = int(vr_frame_number) if is_int else None
         # If we know it's an integer, strong likelihood that it's a frame. Let's process
         if is_int:
             # Find all rows where the frame number matches
-            frame_positions = pdf[pdf[frame_colname]==int(vr_frame_number)]
-            if len(frame_positions.index) > 0:
-                # Extract the positions in vr screen space
-                xs = frame_positions[x_colname].tolist()
-                ys = frame_positions[y_colname].tolist()
-                positions = list(zip(xs, ys))
-                # Transform the vr screen space coords to video coords
-                repositions = [trial.transformer.screen_to_frame(p) for p in positions]
-                rx, ry = zip(*repositions)
-                frame_positions['video_x'] = rx
-                frame_positions['video_y'] = ry
+            rows = frame_lookup.get(int(vr_frame_number))
+            if rows is not None:
+                frame_positions = pdf.iloc[rows].copy()
+                # Transform the vr screen space coords to video coords, for every projection
+                repositions = apply_projections(frame_positions, projections)
                 # Cache the results
                 reposition_dfs.append(frame_positions)
                 # If we are outputting, we modify the outframe
                 if output_video or preview:
-                    for rp in repositions: 
-                        outframe.draw_marker(rp, color=[255,225,0], inplace=True)
+                    for p, projected in zip(projections, repositions):
+                        for rp in projected: 
+                            outframe.draw_marker(rp, color=p['color'], inplace=True)
         # if we are outputting, write the frame
         if output_video: out.write(outframe.frame)
         if preview: 
@@ -116,6 +203,34 @@ def estimate_positions(trial:Trial,
     return rpdf
 
 
+# === Project positions using an existing video timeline, without touching the video ===
+#   `timeline` maps video frame indices to VR frame numbers (or None), as filled in by `estimate_positions()`.
+#   Produces the same rows as `estimate_positions()`, in video frame order.
+#   Example:
+#   rpdf = project_timeline(pd.read_csv(positions_filepath), timeline, trial.transformer)
+def project_timeline(pdf, 
+                     timeline:dict, 
+                     transformer:Transformer,
+                     frame_colname:str='frame',
+                     x_colname:str='left_screen_pos_x',
+                     y_colname:str='left_screen_pos_y',
+                     projections=None):
+    projections = normalize_projections(projections, transformer, x_colname=x_colname, y_colname=y_colname)
+    rpdf = match_timeline(pdf, timeline, frame_colname=frame_colname)
+    apply_projections(rpdf, projections)
+    return rpdf
+
+# === Match positions to the video frames of a timeline, in video frame order ===
+#   A VR frame shown on several video frames yields its rows once per video frame, as in `estimate_positions()`.
+def match_timeline(pdf, timeline:dict, frame_colname:str='frame'):
+    tdf = pd.DataFrame([(fidx, vr) for fidx, vr in sorted(timeline.items()) if vr is not None], columns=['_fidx', '_vr'])
+    pdf = pdf.copy()
+    pdf[frame_colname] = pdf[frame_colname].astype(int)
+    pdf['_row'] = np.arange(len(pdf.index))
+    rpdf = tdf.merge(pdf, left_on='_vr', right_on=frame_colname).sort_values(['_fidx', '_row'], kind='stable')
+    return rpdf.drop(columns=['_fidx', '_vr', '_row']).reset_index(drop=True)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('root_dir', help="Relative directory to your trial", type=str)
@@ -125,7 +240,15 @@ if __name__ == '__main__':
     parser.add_argument('-od', '--output_dirname', help="Output directory relative to root_dir", type=str, default='estimations')
     parser.add_argument('-ov', '--output_video', help="If set, will generate an output video with the transformed positions per frame", action="store_true")
     parser.add_argument('-p', '--preview', help="If set, will preview transformations live", action="store_true")
+    parser.add_argument('-pj', '--projection', help="Projection as X_COL Y_COL [TRANSFORMER_JSON [NAME [B,G,R]]]. TRANSFORMER_JSON is relative to the trial dir, or '-' for the trial's own. Can be repeated; all are evaluated in one pass and replace the default columns", nargs='+', action='append', default=None)
     args = parser.parse_args()
 
     trial = Trial(root_dir=args.root_dir, json_src=args.trial_filename)
-    estimate_positions(trial, args.positions_filename, args.video_filename, output_dirname=args.output_dirname, output_video=args.output_video, preview=args.preview, verbose=True )
+    projections = None
+    if args.projection is not None:
+        assert all(2 <= len(p) <= 5 for p in args.projection), "Each projection needs X_COL Y_COL and an optional TRANSFORMER_JSON, NAME, and B,G,R color"
+        projections = [(p[0], p[1],
+                        Transformer(json_src=os.path.join(args.root_dir, p[2])) if len(p) > 2 and p[2] != '-' else None,
+                        [int(c) for c in p[4].split(',')] if len(p) > 4 else None,
+                        p[3] if len(p) > 3 else None) for p in args.projection]
+    estimate_positions(trial, args.positions_filename, args.video_filename, output_dirname=args.output_dirname, projections=projections, output_video=args.output_video, preview=args.preview, verbose=True )
@@ -3,12 +3,15 @@ import shutil
 import numpy as np
 import cv2
 import string
-import easyocr
-reader = easyocr.Reader(['en'])
+
+# The OCR engine is created lazily, so that importing this module does not load easyocr's models.
+# Any object with an easyocr-style `readtext(img)` method can be swapped in via `set_ocr_reader()`.
+reader = None
 
 fourcc_to_ext = {
     # --- MP4 container codecs ---
     "mp4v": ".mp4",    # MPEG-4 Part 2
+    "FMP4": ".mp4",    # MPEG-4 Part 2, as reported by FFmpeg
     "avc1": ".mp4",    # H.264 baseline/main/high
     "H264": ".mp4",    # alt H.264 tag
     "h264": ".mp4",
@@ -118,6 +121,24 @@ def estimate_template_from_image(src_img,
     if verbose: print(f"# Detected Bounding Boxes: {len(bboxes)}")
     return bboxes
 
+# === Get the active OCR engine, creating the default easyocr reader on first use ===
+#   Example:
+#   text = get_ocr_reader().readtext(thr)
+def get_ocr_reader():
+    global reader
+    if reader is None:
+        import easyocr
+        reader = easyocr.Reader(['en'])
+    return reader
+
+# === Replace the active OCR engine. Must expose `readtext(img)` returning [(bbox, text, confidence), ...] ===
+#   Example:
+#   set_ocr_reader(GlyphOCR())
+def set_ocr_reader(engine):
+    global reader
+    reader = engine
+    return reader
+
 # === Checks whether a provided string value can be parsed as an integer
 #   Example:
 #   is_int = check_int("1123") <-- returns TRUE
@@ -126,6 +147,22 @@ def check_int(s:str):
     except ValueError: return False
     else: return True
 
+# === Reads a frame number from an already cropped, grayscale frame counter ROI
+# Returns the estimated frame number, if it's an int, and the thresholded ROI. Pass `thresholded=True` for ROIs that are already binary ===
+#   Example:
+#   vr_frame_number, is_int, thr = read_frame_number(grayscale, threshold=125)
+def read_frame_number(grayscale, threshold:int=125, thresholded:bool=False):
+    # Binary Thresholding for easier processing
+    thr = grayscale if thresholded else cv2.threshold(grayscale, threshold, 255, cv2.THRESH_BINARY)[1]
+    # OCR
+    screen_text = get_ocr_reader().readtext(thr)
+    conf_text = None
+    is_int = False
+    if len(screen_text) > 0:
+        conf_text = screen_text[0][1]
+        is_int = check_int(conf_text)
+    return conf_text, is_int, thr
+
 # === Checks for a frame number in a provided image. Handles only raw video frames
 # Returns the estimated frame number, if it's an int, and the outputted frames (if toggled) ===
 #   Example:
@@ -136,16 +173,9 @@ def check_frame_number(
         return_frames:bool=True ):
     # Cropping (old formula: crop_h[0]:crop_h[1], crop_w[0]:crop_w[1])
     crop = frame[crop_min[1]:crop_max[1], crop_min[0]:crop_max[0]]
-    # Grayscale & Binary Thresholding for easier processing
+    # Grayscale, then threshold and OCR
     grayscale = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-    thr = cv2.threshold(grayscale, threshold, 255, cv2.THRESH_BINARY)[1]
-    # OCR
-    screen_text = reader.readtext(thr)
-    conf_text = None
-    is_int = False
-    if len(screen_text) > 0:
-        conf_text = screen_text[0][1]
-        is_int = check_int(conf_text)
+    conf_text, is_int, thr = read_frame_number(grayscale, threshold=threshold)
     if return_frames:
         return conf_text, is_int, crop, grayscale, thr
     return conf_text, is_int
@@ -50,14 +50,16 @@ def draw_rectangle(event, x, y, flags, param):
 # The positions marked and a CSV with the re-positioned entities.
 # ------------------------------------------------------------
 
-def frame_count_bounding_box(video_filepath:str):
+def frame_count_bounding_box(video_filepath:str=None, frame=None):
     global frame_for_roi, display_frame, roi, x1, y1, x2, y2
 
-    # Initialize a frame capture, get the first frame
-    cap = cv2.VideoCapture(video_filepath)
-    ret, frame = cap.read()
-    if not ret:
-        raise RuntimeError("Failed to read first frame.")
+    # Initialize a frame capture, get the first frame. Live sources can pass a frame they already captured.
+    if frame is None:
+        cap = cv2.VideoCapture(video_filepath)
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            raise RuntimeError("Failed to read first frame.")
     frame_for_roi = frame.copy()
     display_frame = frame.copy()
     cv2.namedWindow("Select ROI")
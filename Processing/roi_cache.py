@@ -0,0 +1,202 @@
+import os
+import json
+import struct
+import numpy as np
+import cv2
+import argparse
+from tqdm import tqdm
+import helpers as h
+import ocr
+
+# ------------------------------------------------------------
+# ROI CACHE: Decode a recording once, and keep its frame counter ROIs in a memory-mapped file.
+# Later passes (OCR with another threshold or engine, timeline rebuilds, notebooks) read zero-copy
+# slices from the memmap instead of decoding the video again. Optionally also keeps downscaled
+# full frames, and always keeps the first full-resolution frame for ROI selection.
+#
+# File layout: a fixed-size header (magic, JSON length, JSON), the first frame as (H, W, 3) uint8,
+# then one record per frame holding the ROI and, if enabled, the downscaled frame.
+# ------------------------------------------------------------
+
+MAGIC = b'SVMROI01'
+HEADER_SIZE = 4096
+
+
+# === ROI Cache Class ===
+#   Read-only view of a cache file. `rois` is (frames, h, w) and `thumbnails` is (frames, th, tw, 3) or None;
+#   both are memmap views, so slicing them does not copy or decode anything.
+#   Example:
+#   cache = ROICache('./sample/calibration.mp4.roicache')
+#   timeline = cache.timeline(threshold=140)
+class ROICache:
+    def __init__(self, filepath:str):
+        self.filepath = filepath
+        with open(filepath, 'rb') as file:
+            assert file.read(len(MAGIC)) == MAGIC, f"'{filepath}' is not an ROI cache."
+            length = struct.unpack('<I', file.read(4))[0]
+            self.header = json.loads(file.read(length))
+        assert self.header['frames'] > 0, f"ROI cache '{filepath}' does not contain any frames."
+        frame_shape = tuple(self.header['frame_shape'])
+        self.first_frame = np.memmap(filepath, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=frame_shape)
+        self.records = np.memmap(filepath, dtype=record_dtype(self.header), mode='r',
+                                 offset=HEADER_SIZE + int(np.prod(frame_shape)), shape=(self.header['frames'],))
+        self.rois = self.records['roi']
+        self.thumbnails = self.records['thumbnail'] if self.header['thumbnail_shape'] is not None else None
+
+    # Getters
+    # ------------------------------------------
+    @property
+    def frames(self):
+        return self.header['frames']
+    @property
+    def thresholded(self):
+        return self.header['threshold'] is not None
+    @property
+    def bbox(self):
+        return tuple(self.header['bbox_min']), tuple(self.header['bbox_max'])
+    def matches(self, video_filepath:str, bbox_min=None, bbox_max=None, threshold:int=None, downscale:float=None):
+        stat = os.stat(video_filepath)
+        if self.header['video_size'] != stat.st_size or self.header['video_mtime'] != stat.st_mtime: return False
+        if bbox_min is not None and list(bbox_min) != self.header['bbox_min']: return False
+        if bbox_max is not None and list(bbox_max) != self.header['bbox_max']: return False
+        return self.header['threshold'] == threshold and self.header['downscale'] == downscale
+
+    # Applications
+    # ------------------------------------------
+    # OCR a single cached ROI. `threshold` is ignored if the cache already stores thresholded ROIs.
+    def frame_number(self, fidx:int, threshold:int=125):
+        vr_frame_number, is_int, _ = h.read_frame_number(self.rois[fidx], threshold=threshold, thresholded=self.thresholded)
+        return vr_frame_number, is_int
+    # OCR every cached ROI into a timeline, as accepted by `estimate_positions()` and `project_timeline()`
+    def timeline(self, threshold:int=125, start:int=0, stop:int=None, verbose:bool=False):
+        timeline = {}
+        indices = range(start, self.frames if stop is None else min(stop, self.frames))
+        for fidx in (tqdm(indices) if verbose else indices):
+            vr_frame_number, is_int = self.frame_number(fidx, threshold=threshold)
+            timeline[fidx] = int(vr_frame_number) if is_int else None
+        return timeline
+
+# === Structured dtype of a single per-frame record ===
+def record_dtype(header):
+    fields = [('roi', np.uint8, tuple(header['roi_shape']))]
+    if header['thumbnail_shape'] is not None:
+        fields.append(('thumbnail', np.uint8, tuple(header['thumbnail_shape'])))
+    return np.dtype(fields)
+
+# === Decode a video once, writing its ROI cache ===
+#   `threshold` stores binary ROIs instead of grayscale; leave it as None to sweep thresholds later.
+#   `downscale` additionally stores full frames resized by that factor (e.g. 0.25).
+#   Without a bbox, the ROI is selected on the first decoded frame, so the video is only opened once.
+#   Example:
+#   cache = build_roi_cache('./sample/calibration.mp4', bbox_min=(0,0), bbox_max=(300,80), downscale=0.25)
+def build_roi_cache(video_filepath:str,
+                    cache_filepath:str=None,
+                    bbox_min=None,
+                    bbox_max=None,
+                    threshold:int=None,
+                    downscale:float=None,
+                    verbose:bool=True):
+    if cache_filepath is None: cache_filepath = video_filepath + '.roicache'
+    cap = cv2.VideoCapture(video_filepath)
+    assert cap.isOpened(), f"Could not open video '{video_filepath}'"
+    ok, frame = cap.read()
+    assert ok, f"Could not read the first frame of '{video_filepath}'"
+    if bbox_min is None or bbox_max is None:
+        bbox_min, bbox_max = ocr.frame_count_bounding_box(frame=frame)
+
+    # Clamp the ROI to the frame, so that every record has the same shape
+    height, width = frame.shape[:2]
+    x1, y1 = max(0, int(bbox_min[0])), max(0, int(bbox_min[1]))
+    x2, y2 = min(width, int(bbox_max[0])), min(height, int(bbox_max[1]))
+    assert x2 > x1 and y2 > y1, f"ROI ({x1},{y1}) - ({x2},{y2}) is empty"
+    thumbnail_size = (max(1, int(width*downscale)), max(1, int(height*downscale))) if downscale is not None else None
+    stat = os.stat(video_filepath)
+    header = {
+        'video_filepath': os.path.abspath(video_filepath),
+        'video_size': stat.st_size,
+        'video_mtime': stat.st_mtime,
+        'fps': cap.get(cv2.CAP_PROP_FPS),
+        'frames': 0,
+        'frame_shape': list(frame.shape),
+        'bbox_min': [x1, y1],
+        'bbox_max': [x2, y2],
+        'roi_shape': [y2-y1, x2-x1],
+        'threshold': threshold,
+        'downscale': downscale,
+        'thumbnail_shape': [thumbnail_size[1], thumbnail_size[0], 3] if thumbnail_size is not None else None,
+    }
+
+    # Write to a temporary file first, so that an interrupted build never leaves a truncated cache behind
+    tmp_filepath = cache_filepath + '.tmp'
+    pbar = tqdm(total=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), disable=not verbose, desc="Caching ROIs")
+    with open(tmp_filepath, 'wb') as file:
+        file.write(b'\0' * HEADER_SIZE)
+        file.write(np.ascontiguousarray(frame).tobytes())
+        while ok:
+            roi = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+            if threshold is not None: roi = cv2.threshold(roi, threshold, 255, cv2.THRESH_BINARY)[1]
+            file.write(roi.tobytes())
+            if thumbnail_size is not None:
+                file.write(cv2.resize(frame, thumbnail_size, interpolation=cv2.INTER_AREA).tobytes())
+            header['frames'] += 1
+            pbar.update(1)
+            ok, frame = cap.read()
+        # Fill in the header now that the frame count is known
+        payload = json.dumps(header).encode('utf-8')
+        assert len(MAGIC) + 4 + len(payload) <= HEADER_SIZE, "ROI cache header is too large"
+        file.seek(0)
+        file.write(MAGIC + struct.pack('<I', len(payload)) + payload)
+    pbar.close()
+    cap.release()
+    os.replace(tmp_filepath, cache_filepath)
+    if verbose: print(f"\tCached {header['frames']} ROIs in '{cache_filepath}'")
+    return ROICache(cache_filepath)
+
+# === Open a video's ROI cache, building it only if it is missing or stale ===
+#   Example:
+#   cache = load_roi_cache('./sample/calibration.mp4', bbox_min=(0,0), bbox_max=(300,80))
+def load_roi_cache(video_filepath:str,
+                   cache_filepath:str=None,
+                   bbox_min=None,
+                   bbox_max=None,
+                   threshold:int=None,
+                   downscale:float=None,
+                   verbose:bool=True):
+    if cache_filepath is None: cache_filepath = video_filepath + '.roicache'
+    if os.path.exists(cache_filepath):
+        cache = ROICache(cache_filepath)
+        if cache.matches(video_filepath, bbox_min=bbox_min, bbox_max=bbox_max, threshold=threshold, downscale=downscale):
+            return cache
+        if verbose: print(f"\tROI cache '{cache_filepath}' is stale; rebuilding")
+    return build_roi_cache(video_filepath, cache_filepath=cache_filepath, bbox_min=bbox_min, bbox_max=bbox_max,
+                           threshold=threshold, downscale=downscale, verbose=verbose)
+
+# === OCR the cached ROIs at several thresholds, without decoding the video ===
+#   Returns the fraction of frames read as an integer for each threshold.
+#   Example:
+#   rates = sweep_thresholds(cache, range(100, 200, 10))
+def sweep_thresholds(cache:ROICache, thresholds, verbose:bool=True):
+    assert not cache.thresholded, "The ROI cache stores thresholded ROIs; rebuild it without a threshold to sweep"
+    rates = {}
+    for threshold in thresholds:
+        timeline = cache.timeline(threshold=threshold)
+        rates[threshold] = sum(v is not None for v in timeline.values()) / cache.frames
+        if verbose: print(f"\tThreshold {threshold}: {rates[threshold]*100:.1f}% of frames read")
+    return rates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_filepath', help="Video to cache", type=str)
+    parser.add_argument('-c', '--cache_filepath', help="Cache filepath. Defaults to the video filepath + '.roicache'", type=str, default=None)
+    parser.add_argument('-roi', '--roi', help="Frame counter ROI as x1 y1 x2 y2. Selected from the first frame if not set", type=int, nargs=4, default=None)
+    parser.add_argument('-thr', '--threshold', help="If set, stores binary ROIs at this threshold instead of grayscale", type=int, default=None)
+    parser.add_argument('-ds', '--downscale', help="If set, also stores full frames resized by this factor", type=float, default=None)
+    parser.add_argument('-s', '--sweep', help="Thresholds to test OCR with once the cache is built", type=int, nargs='+', default=None)
+    args = parser.parse_args()
+
+    bbox_min, bbox_max = ((args.roi[0], args.roi[1]), (args.roi[2], args.roi[3])) if args.roi is not None else (None, None)
+    cache = load_roi_cache(args.video_filepath, cache_filepath=args.cache_filepath, bbox_min=bbox_min, bbox_max=bbox_max,
+                           threshold=args.threshold, downscale=args.downscale)
+    if args.sweep is not None:
+        sweep_thresholds(cache, args.sweep)
@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import uuid
+import threading
+import numpy as np
+import pandas as pd
+import argparse
+import urllib.request
+import urllib.error
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import helpers as h
+from classes import Trial, Transformer
+from calibrate import calibrate_trial
+from estimate import estimate_positions, project_timeline
+
+# ------------------------------------------------------------
+# SERVICE: A resident worker that keeps the OCR engine, Transformers, positions CSVs, and video
+# timelines (video frame -> VR frame) in memory between jobs. Jobs are posted as JSON to a
+# localhost HTTP endpoint and run on a worker pool. Re-estimating a video whose timeline is
+# already known skips both decoding and OCR, so it takes milliseconds instead of seconds.
+# ------------------------------------------------------------
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_ANCHOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anchor.png')
+
+# === Service Class ===
+#   Owns the caches and the worker pool. Can be used directly in Python, or served over HTTP with `serve()`.
+#   Each job is a dict with a 'type' of 'calibrate', 'estimate', or 'project'. See the matching methods for fields.
+#   Example:
+#   service = ProjectionService(workers=2)
+#   job_id = service.submit({'type':'project', 'transformer':'./sample/transformer.json', 'points':[[840,880]]})
+#   record = service.result(job_id, wait=True)
+class ProjectionService:
+    def __init__(self, workers:int=2, preload_ocr:bool=True, max_jobs:int=1000, verbose:bool=True):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.verbose = verbose
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='svm-worker')
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()   # job id -> record
+        self.transformers = {}      # (filepath, mtime) -> Transformer
+        self.positions = {}         # (filepath, mtime) -> DataFrame
+        self.timelines = {}         # (video filepath, mtime, bbox_min, bbox_max) -> {'frames':dict, 'complete':bool, 'lock':Lock}
+        self.dir_locks = {}         # output directory -> Lock, so jobs never clear a directory another job is writing to
+        if preload_ocr:
+            if verbose: print("Loading OCR engine...")
+            h.get_ocr_reader()
+
+    # Caches
+    # ------------------------------------------
+    # Caches are keyed by modification time, so files edited on disk are reloaded automatically
+    def _cached(self, cache:dict, filepath:str, loader, *extra):
+        filepath = os.path.abspath(filepath)
+        assert os.path.exists(filepath), f"'{filepath}' does not exist."
+        key = (filepath, os.path.getmtime(filepath), *extra)
+        with self.lock:
+            if key in cache: return cache[key]
+        value = loader(filepath)
+        with self.lock:
+            # Drop stale entries for the same file
+            for k in [k for k in cache if k[0] == filepath and k != key]: del cache[k]
+            cache[key] = value
+        return value
+    def load_transformer(self, filepath:str):
+        return self._cached(self.transformers, filepath, lambda p: Transformer(json_src=p))
+    def load_positions(self, filepath:str, frame_colname:str='frame'):
+        def loader(p):
+            pdf = pd.read_csv(p)
+            pdf[frame_colname] = pdf[frame_colname].astype(int)
+            return pdf
+        return self._cached(self.positions, filepath, loader, frame_colname)
+    def load_timeline(self, video_filepath:str, bbox_min, bbox_max):
+        return self._cached(self.timelines, video_filepath, lambda p: {'frames':{}, 'complete':False, 'lock':threading.Lock()}, tuple(bbox_min), tuple(bbox_max))
+    def dir_lock(self, dirpath:str):
+        dirpath = os.path.abspath(dirpath)
+        with self.lock:
+            if dirpath not in self.dir_locks: self.dir_locks[dirpath] = threading.Lock()
+            return self.dir_locks[dirpath]
+    def load_trial(self, root_dir:str, trial_filename:str):
+        with open(os.path.join(root_dir, trial_filename), 'r') as file:
+            data = json.load(file)
+        assert data.get('transformer'), f"Trial '{trial_filename}' does not have a Transformer; calibrate it first."
+        transformer = self.load_transformer(os.path.join(root_dir, data['transformer']))
+        return Trial(root_dir=root_dir, trial_name=data['trial_name'], transformer=transformer)
+
+    # Jobs
+    # ------------------------------------------
+    # Calibrate a trial. Needs 'root_dir', 'name', 'bbox_min', 'bbox_max'; the ROI cannot be picked interactively here.
+    def calibrate(self, job:dict, job_id:str=None):
+        assert 'bbox_min' in job and 'bbox_max' in job, "Calibration jobs need 'bbox_min' and 'bbox_max' for the frame counter ROI"
+        trial = Trial(root_dir=job['root_dir'], trial_name=job['name'])
+        # calibrate_trial clears 'calibrations/' inside the trial, so calibrations of the same trial run one at a time
+        with self.dir_lock(os.path.join(trial.root_dir, 'calibrations')):
+            calibrate_trial(trial,
+                            job.get('anchor_filepath', DEFAULT_ANCHOR),
+                            job.get('video_filename', 'calibration.mp4'),
+                            job.get('targets_filename', 'calibration.csv'),
+                            vr_x_colname=job.get('x_colname', 'left_screen_pos_x'),
+                            vr_y_colname=job.get('y_colname', 'left_screen_pos_y'),
+                            bbox_min=job['bbox_min'],
+                            bbox_max=job['bbox_max'],
+                            low_memory=job.get('low_memory', False),
+                            validate=job.get('validate', True),
+                            verbose=self.verbose)
+        return {
+            'trial': os.path.join(trial.root_dir, f'{trial.trial_name}.json'),
+            'transformer': os.path.join(trial.root_dir, f'{trial.transformer.name}.json'),
+            'transform': h.to_serializable(trial.transformer.transform)
+        }
+
+    # Estimate positions. Needs 'root_dir', 'trial_filename', 'positions_filename', 'video_filename', 'bbox_min', 'bbox_max'.
+    # Optional 'projections' is a list of {'x_colname', 'y_colname', 'transformer', 'color', 'name'}, where 'transformer'
+    # is a filepath relative to 'root_dir' and defaults to the trial's. All projections share one pass over the video.
+    # Results go to 'estimations/<job id>/' unless 'output_dirname' is given; jobs sharing an output directory run one at a time.
+    # If the video's timeline is cached and no output video is requested, the video is not opened at all.
+    # Only one job builds a cold timeline; others on the same video wait for it, then reuse it.
+    def estimate(self, job:dict, job_id:str=None):
+        assert 'bbox_min' in job and 'bbox_max' in job, "Estimation jobs need 'bbox_min' and 'bbox_max' for the frame counter ROI"
+        root_dir = job['root_dir']
+        trial = self.load_trial(root_dir, job['trial_filename'])
+        frame_colname = job.get('frame_colname', 'frame')
+        x_colname = job.get('x_colname', 'left_screen_pos_x')
+        y_colname = job.get('y_colname', 'left_screen_pos_y')
+        output_dirname = job.get('output_dirname') or os.path.join('estimations', job_id if job_id is not None else uuid.uuid4().hex)
+        outdir = os.path.join(root_dir, output_dirname)
+        output_video = job.get('output_video', False)
+        timeline = self.load_timeline(os.path.join(root_dir, job['video_filename']), job['bbox_min'], job['bbox_max'])
+        projections = None
+        if job.get('projections') is not None:
+            projections = [(p['x_colname'], p['y_colname'],
+                            self.load_transformer(os.path.join(root_dir, p['transformer'])) if p.get('transformer') else None,
+                            p.get('color'), p.get('name')) for p in job['projections']]
+
+        def run_estimation():
+            return estimate_positions(trial, job['positions_filename'], job['video_filename'],
+                                      frame_colname=frame_colname,
+                                      x_colname=x_colname,
+                                      y_colname=y_colname,
+                                      output_dirname=output_dirname,
+                                      bbox_min=job['bbox_min'],
+                                      bbox_max=job['bbox_max'],
+                                      timeline=timeline['frames'],
+                                      projections=projections,
+                                      output_video=output_video,
+                                      verbose=self.verbose)
+
+        rpdf = None
+        with timeline['lock']:
+            if not timeline['complete']:
+                with self.dir_lock(outdir):
+                    rpdf = run_estimation()
+                timeline['complete'] = True
+        if rpdf is None:
+            with self.dir_lock(outdir):
+                if output_video:
+                    rpdf = run_estimation()
+                else:
+                    pdf = self.load_positions(os.path.join(root_dir, job['positions_filename']), frame_colname=frame_colname)
+                    rpdf = project_timeline(pdf, timeline['frames'], trial.transformer, frame_colname=frame_colname, x_colname=x_colname, y_colname=y_colname, projections=projections)
+                    h.mkdirs(outdir)
+                    rpdf.to_csv(os.path.join(outdir, 'repositions.csv'), index=0)
+        return {
+            'repositions': os.path.join(outdir, 'repositions.csv'),
+            'rows': len(rpdf.index),
+            'cached_timeline': len(timeline['frames'])
+        }
+
+    # Project raw screen points. Needs 'points', and either 'transformer' (a filepath) or 'root_dir' + 'trial_filename'.
+    def project(self, job:dict, job_id:str=None):
+        if 'transformer' in job: transformer = self.load_transformer(job['transformer'])
+        else: transformer = self.load_trial(job['root_dir'], job['trial_filename']).transformer
+        points = np.array(job['points'], dtype=float).reshape(-1, 2)
+        coords = np.column_stack([points, np.ones(len(points))])
+        return {'points': h.to_serializable(np.dot(coords, np.array(transformer.transform)))}
+
+    def run(self, job:dict, job_id:str=None):
+        handlers = {'calibrate': self.calibrate, 'estimate': self.estimate, 'project': self.project}
+        assert job.get('type') in handlers, f"Unknown job type '{job.get('type')}'; expected one of {list(handlers.keys())}"
+        return handlers[job['type']](job, job_id=job_id)
+
+    # Queue
+    # ------------------------------------------
+    def submit(self, job:dict):
+        job_id = uuid.uuid4().hex
+        record = {'id':job_id, 'type':job.get('type'), 'status':'queued', 'submitted':time.time()}
+        # Records are only ever changed and copied under `self.lock`, so `result()` never sees one mid-update
+        def work():
+            started = time.time()
+            with self.lock:
+                record.update({'status':'running', 'started':started})
+            try:
+                update = {'result':self.run(job, job_id=job_id), 'status':'done'}
+            except Exception as e:
+                update = {'error':f"{type(e).__name__}: {e}", 'status':'failed'}
+            finished = time.time()
+            update.update({'finished':finished, 'seconds':finished - started})
+            with self.lock:
+                record.update(update)
+        with self.lock:
+            self.jobs[job_id] = record
+            # Forget the oldest finished jobs once we hold too many
+            while len(self.jobs) > self.max_jobs:
+                oldest = next((k for k, r in self.jobs.items() if r['status'] in ('done','failed')), None)
+                if oldest is None: break
+                del self.jobs[oldest]
+            record['future'] = self.executor.submit(work)
+        return job_id
+    def result(self, job_id:str, wait:bool=False, timeout:float=None):
+        with self.lock:
+            record = self.jobs.get(job_id)
+            if record is None: return None
+            future = record['future']
+        if wait: future.result(timeout=timeout)
+        with self.lock:
+            return {k:v for k, v in record.items() if k != 'future'}
+    def status(self):
+        with self.lock:
+            counts = {}
+            for r in self.jobs.values(): counts[r['status']] = counts.get(r['status'], 0) + 1
+            return {
+                'workers': self.workers,
+                'jobs': counts,
+                'transformers': len(self.transformers),
+                'positions': len(self.positions),
+                'timelines': len(self.timelines)
+            }
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+# === HTTP Handler ===
+#   GET  /status        -> cache and queue counts
+#   POST /jobs          -> submit a job. Waits for the result unless the body sets "wait": false
+#   GET  /jobs/<id>     -> job record, including 'result' or 'error' once finished
+class ServiceHandler(BaseHTTPRequestHandler):
+    service:ProjectionService = None
+
+    def send_json(self, code:int, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/status':
+            return self.send_json(200, self.service.status())
+        if self.path.startswith('/jobs/'):
+            record = self.service.result(self.path[len('/jobs/'):])
+            if record is None: return self.send_json(404, {'error': 'Unknown job'})
+            return self.send_json(200, record)
+        self.send_json(404, {'error': f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            return self.send_json(404, {'error': f"Unknown path '{self.path}'"})
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            assert isinstance(job, dict), "Job must be a JSON object"
+        except (json.JSONDecodeError, AssertionError) as e:
+            return self.send_json(400, {'error': f"Invalid job: {e}"})
+        wait = job.pop('wait', True)
+        job_id = self.service.submit(job)
+        if not wait:
+            return self.send_json(202, {'id': job_id, 'status': 'queued'})
+        record = self.service.result(job_id, wait=True)
+        self.send_json(200 if record['status'] == 'done' else 500, record)
+
+    def log_message(self, format, *args):
+        if self.service.verbose: BaseHTTPRequestHandler.log_message(self, format, *args)
+
+# === Serve a ProjectionService over localhost HTTP until interrupted ===
+def serve(host:str=DEFAULT_HOST, port:int=DEFAULT_PORT, workers:int=2, verbose:bool=True):
+    service = ProjectionService(workers=workers, verbose=verbose)
+    handler = type('BoundServiceHandler', (ServiceHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving on http://{host}:{port} with {workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+# === Client helper: post a job to a running service and return its record ===
+#   Example:
+#   record = submit_job({'type':'estimate', 'root_dir':'./sample', 'trial_filename':'trial.json', ...})
+def submit_job(job:dict, host:str=DEFAULT_HOST, port:int=DEFAULT_PORT, wait:bool=True, timeout:float=None):
+    body = json.dumps(dict(job, wait=wait)).encode('utf-8')
+    req = urllib.request.Request(f"http://{host}:{port}/jobs", data=body, headers={'Content-Type':'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return json.loads(res.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="Start the service")
+    serve_parser.add_argument('-H', '--host', help="Host to bind to", type=str, default=DEFAULT_HOST)
+    serve_parser.add_argument('-p', '--port', help="Port to listen on", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('-w', '--workers', help="Number of worker threads", type=int, default=2)
+    serve_parser.add_argument('-q', '--quiet', help="If set, silences per-job and per-request output", action="store_true")
+    submit_parser = subparsers.add_parser('submit', help="Post a job to a running service")
+    submit_parser.add_argument('job', help="Job as a JSON string, or a path to a JSON file", type=str)
+    submit_parser.add_argument('-H', '--host', help="Host of the service", type=str, default=DEFAULT_HOST)
+    submit_parser.add_argument('-p', '--port', help="Port of the service", type=int, default=DEFAULT_PORT)
+    submit_parser.add_argument('-nw', '--no_wait', help="If set, returns the job id immediately", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(host=args.host, port=args.port, workers=args.workers, verbose=not args.quiet)
+    else:
+        if os.path.exists(args.job):
+            with open(args.job, 'r') as file: job = json.load(file)
+        else: job = json.loads(args.job)
+        print(json.dumps(submit_job(job, host=args.host, port=args.port, wait=not args.no_wait), indent=2))
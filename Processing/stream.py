@@ -0,0 +1,279 @@
+import os
+import csv
+import time
+import threading
+import numpy as np
+import cv2
+import argparse
+import warnings
+import helpers as h
+import ocr
+from classes import Trial, Transformer, Frame
+
+warnings.filterwarnings(
+    "ignore",
+    message="'pin_memory' argument is set as true but not supported on MPS"
+)
+
+# ------------------------------------------------------------
+# STREAMING: Estimate positions live, from any `cv2.VideoCapture` source (capture device, stream
+# URL, pipe, or a file replayed in real time). Frames are captured on a background thread into a
+# latest-frame-wins buffer, so when OCR falls behind, stale frames are dropped instead of queued.
+# Positions are read incrementally from a positions CSV that Unity may still be writing.
+# ------------------------------------------------------------
+
+# === Latest-Frame Buffer ===
+#   A single-slot buffer shared by the capture thread and the processing loop.
+#   Putting a frame while the previous one is unread replaces it and counts it as dropped.
+class LatestFrameBuffer:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.item = None
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        with self.cond:
+            if self.item is not None: self.dropped += 1
+            self.item = item
+            self.cond.notify()
+    def get(self, timeout:float=None):
+        with self.cond:
+            self.cond.wait_for(lambda: self.item is not None or self.closed, timeout=timeout)
+            item, self.item = self.item, None
+            return item
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+# === Positions Tailer ===
+#   Incrementally reads a positions CSV that may still be growing. Only complete lines are parsed.
+#   Keeps the rows of the most recent `retain` VR frames, so memory stays bounded on long sessions.
+class PositionsTailer:
+    def __init__(self, filepath:str, frame_colname:str='frame', x_colname:str='left_screen_pos_x', y_colname:str='left_screen_pos_y', retain:int=10000):
+        self.filepath = filepath
+        self.frame_colname = frame_colname
+        self.x_colname = x_colname
+        self.y_colname = y_colname
+        self.retain = retain
+        self.file = None
+        self.header = None
+        self.partial = ""
+        self.frames = {}    # VR frame -> list of rows, in insertion order
+
+    def poll(self):
+        if self.file is None:
+            if not os.path.exists(self.filepath): return 0
+            self.file = open(self.filepath, 'r', encoding='utf-8-sig', newline='')
+        chunk = self.file.read()
+        if len(chunk) == 0: return 0
+        lines = (self.partial + chunk).split('\n')
+        self.partial = lines.pop()  # The last line may still be mid-write
+        added = 0
+        for row in csv.reader(line.rstrip('\r') for line in lines if len(line.strip()) > 0):
+            if self.header is None:
+                self.header = row
+                self.frame_idx = row.index(self.frame_colname)
+                self.x_idx = row.index(self.x_colname)
+                self.y_idx = row.index(self.y_colname)
+                continue
+            self.frames.setdefault(int(float(row[self.frame_idx])), []).append(row)
+            added += 1
+        while len(self.frames) > self.retain:
+            del self.frames[next(iter(self.frames))]
+        return added
+    def get(self, vr_frame:int):
+        return self.frames.get(vr_frame)
+    def close(self):
+        if self.file is not None: self.file.close()
+
+
+# === Capture loop, run on a background thread ===
+#   `realtime` paces reads at the source fps, which lets a local file stand in for a live source.
+#   `idle_timeout` keeps retrying failed reads for that many seconds, for sources that stall briefly.
+def capture_frames(cap, buffer:LatestFrameBuffer, stop:threading.Event, realtime:bool=False, idle_timeout:float=0.0, poll_interval:float=0.01):
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    fidx, start = 0, time.perf_counter()
+    last_read = start
+    while not stop.is_set():
+        ok, frame = cap.read()
+        if not ok:
+            if time.perf_counter() - last_read < idle_timeout:
+                time.sleep(poll_interval)
+                continue
+            break
+        last_read = time.perf_counter()
+        if realtime and fps > 0:
+            delay = start + fidx/fps - time.perf_counter()
+            if delay > 0: time.sleep(delay)
+        buffer.put((fidx, time.perf_counter(), frame))
+        fidx += 1
+    buffer.close()
+
+# === Stream positions from a live source ===
+#   Returns a summary of throughput and end-to-end latency (capture -> projected coordinates).
+#   Each projected frame is passed to `callback` as it is produced, and optionally appended to `output_filepath`.
+#   Frames whose VR positions have not arrived yet are retried until they are older than `max_lag` seconds.
+#   Example:
+#   summary = stream_positions(trial.transformer, 0, './session/cube_position.csv', bbox_min, bbox_max, preview=True)
+def stream_positions(transformer:Transformer,
+                     source,
+                     positions_filepath:str,
+                     bbox_min=None,
+                     bbox_max=None,
+                     frame_colname:str='frame',
+                     x_colname:str='left_screen_pos_x',
+                     y_colname:str='left_screen_pos_y',
+                     output_filepath:str=None,
+                     callback=None,
+                     max_lag:float=0.5,
+                     realtime:bool=False,
+                     idle_timeout:float=0.0,
+                     duration:float=None,
+                     preview:bool=False,
+                     verbose:bool=True):
+    assert transformer is not None and transformer.transform is not None, "A Transformer with its transformation matrix is required."
+    transform = np.array(transformer.transform)
+    cap = cv2.VideoCapture(source)
+    assert cap.isOpened(), f"Could not open video source '{source}'"
+
+    # The ROI has to come from the stream itself, as live sources cannot be re-opened
+    buffer, stop = LatestFrameBuffer(), threading.Event()
+    if bbox_min is None or bbox_max is None:
+        ok, first = cap.read()
+        assert ok, f"Could not read a frame from '{source}'"
+        bbox_min, bbox_max = ocr.frame_count_bounding_box(frame=first)
+    tailer = PositionsTailer(positions_filepath, frame_colname=frame_colname, x_colname=x_colname, y_colname=y_colname)
+    capture = threading.Thread(target=capture_frames, args=(cap, buffer, stop), kwargs={'realtime':realtime, 'idle_timeout':idle_timeout}, daemon=True)
+
+    outfile, writer = None, None
+    pending = []    # (video frame, capture time, VR frame) still waiting on positions
+    latencies, ocr_times = [], []
+    counts = {'processed':0, 'stale':0, 'unread':0, 'unmatched':0, 'emitted':0, 'rows':0}
+
+    # Project the rows of one VR frame, and hand them off
+    def emit(fidx, captured, vr_frame, rows):
+        nonlocal outfile, writer
+        coords = np.array([[float(r[tailer.x_idx]), float(r[tailer.y_idx]), 1.0] for r in rows])
+        projected = np.dot(coords, transform)
+        latency = time.perf_counter() - captured
+        latencies.append(latency)
+        counts['emitted'] += 1
+        counts['rows'] += len(rows)
+        if output_filepath is not None:
+            if writer is None:
+                # Append, so that restarting a stream mid-session keeps earlier rows; only new files get a header
+                is_new = not os.path.exists(output_filepath) or os.path.getsize(output_filepath) == 0
+                outfile = open(output_filepath, 'a', newline='')
+                writer = csv.writer(outfile)
+                if is_new: writer.writerow(tailer.header + ['video_frame', 'video_x', 'video_y', 'latency_ms'])
+            for r, p in zip(rows, projected):
+                writer.writerow(r + [fidx, p[0], p[1], latency*1000])
+            outfile.flush()
+        if callback is not None:
+            callback({'video_frame':fidx, 'vr_frame':vr_frame, 'positions':projected, 'rows':rows, 'latency':latency})
+        return projected
+
+    # Resolve pending frames whose positions have arrived, returning the projection of `current` if it was one.
+    #   On the `final` pass nothing is left pending: frames without positions count as unmatched.
+    def resolve(current:int=None, final:bool=False):
+        nonlocal pending
+        tailer.poll()
+        drawn, still_pending = None, []
+        for p_fidx, p_captured, p_vr in pending:
+            rows = tailer.get(p_vr)
+            if rows is not None:
+                projected = emit(p_fidx, p_captured, p_vr, rows)
+                if p_fidx == current: drawn = projected
+            elif final or time.perf_counter() - p_captured > max_lag: counts['unmatched'] += 1
+            else: still_pending.append((p_fidx, p_captured, p_vr))
+        pending = still_pending
+        return drawn
+
+    if preview: cv2.namedWindow("Position Estimation")
+    capture.start()
+    start = time.perf_counter()
+    try:
+        while True:
+            if duration is not None and time.perf_counter() - start > duration: break
+            item = buffer.get(timeout=0.1)
+            if item is None:
+                if buffer.closed: break
+                continue
+            fidx, captured, frame = item
+            # Bounded lag: skip frames that are already too old to be useful
+            if time.perf_counter() - captured > max_lag:
+                counts['stale'] += 1
+                continue
+            counts['processed'] += 1
+            ocr_start = time.perf_counter()
+            vr_frame_number, is_int = h.check_frame_number(frame, bbox_min, bbox_max, return_frames=False)
+            ocr_times.append(time.perf_counter() - ocr_start)
+            if is_int: pending.append((fidx, captured, int(vr_frame_number)))
+            else: counts['unread'] += 1
+
+            # Resolve any frames whose positions have arrived since
+            drawn = resolve(current=fidx)
+
+            if preview:
+                outframe = Frame(fidx).set_frame(frame)
+                if drawn is not None:
+                    for rp in drawn: outframe.draw_marker(rp, color=[255,225,0], inplace=True)
+                cv2.imshow("Position Estimation", outframe.frame)
+                cv2.waitKey(1)  # 1 ms delay
+        # The source ended or time ran out: one last poll, so the final frames are not silently dropped
+        resolve(final=True)
+    finally:
+        stop.set()
+        capture.join()
+        cap.release()
+        tailer.close()
+        if outfile is not None: outfile.close()
+        if preview: cv2.destroyWindow("Position Estimation")
+
+    # Summarize
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    summary = dict(counts,
+        captured = buffer.dropped + counts['processed'] + counts['stale'],
+        dropped = buffer.dropped,
+        seconds = elapsed,
+        processed_fps = counts['processed'] / elapsed if elapsed > 0 else None,
+        ocr_ms_mean = float(np.mean(ocr_times) * 1000) if len(ocr_times) > 0 else None,
+        latency_ms_mean = float(latencies_ms.mean()) if len(latencies) > 0 else None,
+        latency_ms_p50 = float(np.percentile(latencies_ms, 50)) if len(latencies) > 0 else None,
+        latency_ms_p95 = float(np.percentile(latencies_ms, 95)) if len(latencies) > 0 else None,
+        latency_ms_max = float(latencies_ms.max()) if len(latencies) > 0 else None,
+    )
+    if verbose:
+        print(f"\tStreamed {summary['captured']} frames: {summary['processed']} processed, {summary['dropped']} dropped, {summary['stale']} stale")
+        if summary['latency_ms_mean'] is not None:
+            print(f"\tLatency: {summary['latency_ms_p50']:.1f}ms median, {summary['latency_ms_p95']:.1f}ms p95, {summary['latency_ms_max']:.1f}ms max")
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root_dir', help="Relative directory to your trial", type=str)
+    parser.add_argument('trial_filename', help="Trial filename relative to your root directory", type=str)
+    parser.add_argument('positions_filename', help="Fileame of the positions file, which may still be written to, relative to the trial dir", type=str)
+    parser.add_argument('source', help="Capture device index, stream URL, or video filepath", type=str)
+    parser.add_argument('-roi', '--roi', help="Frame counter ROI as x1 y1 x2 y2. Selected from the first frame if not set", type=int, nargs=4, default=None)
+    parser.add_argument('-o', '--output', help="Filepath to append projected positions to, relative to the trial dir", type=str, default=None)
+    parser.add_argument('-ml', '--max_lag', help="Seconds after which a frame is too old to process", type=float, default=0.5)
+    parser.add_argument('-rt', '--realtime', help="If set, replays file sources at their own fps", action="store_true")
+    parser.add_argument('-it', '--idle_timeout', help="Seconds to keep retrying failed reads, for growing files or pipes that stall", type=float, default=0.0)
+    parser.add_argument('-d', '--duration', help="Stop after this many seconds", type=float, default=None)
+    parser.add_argument('-p', '--preview', help="If set, will preview projections live", action="store_true")
+    args = parser.parse_args()
+
+    trial = Trial(root_dir=args.root_dir, json_src=args.trial_filename)
+    source = int(args.source) if h.check_int(args.source) else args.source
+    if isinstance(source, str) and os.path.exists(os.path.join(args.root_dir, source)): source = os.path.join(args.root_dir, source)
+    bbox_min, bbox_max = ((args.roi[0], args.roi[1]), (args.roi[2], args.roi[3])) if args.roi is not None else (None, None)
+    stream_positions(trial.transformer, source, os.path.join(args.root_dir, args.positions_filename),
+                     bbox_min=bbox_min, bbox_max=bbox_max,
+                     output_filepath=os.path.join(args.root_dir, args.output) if args.output is not None else None,
+                     max_lag=args.max_lag, realtime=args.realtime, idle_timeout=args.idle_timeout, duration=args.duration, preview=args.preview)
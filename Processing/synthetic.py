@@ -0,0 +1,219 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import cv2
+import argparse
+import helpers as h
+
+# ------------------------------------------------------------
+# SYNTHETIC RECORDINGS: Render fake screen-cast recordings with a known screen -> video mapping.
+# Each recording shows a rising VR frame counter, the 9-point calibration scheme drawn with the
+# anchor image, and then a moving cube. Matching calibration and positions CSVs are written next
+# to the video, so that the full calibration + estimation pipeline can run without a headset.
+# ------------------------------------------------------------
+
+# Recording resolutions of the display devices listed in the README
+DEVICES = {
+    'android':          (2640, 1080),   # Motorola Razr Plus 2024, Meta Horizon App
+    'iphone':           (1792, 828),    # iPhone XR, Meta Horizon App
+    'mac':              (1512, 982),    # Mac M1 Pro, QuickTime Player
+    'pc-horizontal':    (2560, 1080),   # PC w/ Horizontal Monitor, OBS
+    'pc-vertical':      (1080, 1920),   # PC w/ Vertical Monitor, OBS
+}
+
+# Size of a single eye's screen space in VR, and the 9-point calibration offsets around its center
+VR_SCREEN_SIZE = (1680, 1760)
+TARGET_OFFSETS = [(0,0), (50,100), (-50,100), (-50,-100), (50,-100), (150,0), (0,290), (-150,0), (0,-290)]
+
+# Frame counter styling. `GlyphOCR` must be built with the same font settings to read it back.
+COUNTER_FONT = cv2.FONT_HERSHEY_SIMPLEX
+COUNTER_SCALE = 1.5
+COUNTER_THICKNESS = 3
+COUNTER_MARGIN = 10
+
+
+# === Stub OCR Engine ===
+#   Reads frame counters rendered by this module without any downloaded models.
+#   Each reference digit is rendered once; thresholded crops are split into glyphs by their
+#   empty columns, and each glyph is matched against the references. Mimics easyocr's
+#   `readtext()` output of [(bbox, text, confidence)].
+#   Example:
+#   h.set_ocr_reader(GlyphOCR())
+class GlyphOCR:
+    def __init__(self, font=COUNTER_FONT, scale:float=COUNTER_SCALE, thickness:int=COUNTER_THICKNESS, glyph_size=(16,24)):
+        self.glyph_size = glyph_size
+        self.glyphs = {}
+        for d in '0123456789':
+            (w, hh), base = cv2.getTextSize(d, font, scale, thickness)
+            canvas = np.zeros((hh+base+2*thickness, w+2*thickness), dtype=np.uint8)
+            cv2.putText(canvas, d, (thickness, hh+thickness), font, scale, 255, thickness)
+            self.glyphs[d] = self._normalize(canvas)
+
+    # Crop a binary glyph to its content and rescale it to the reference size
+    def _normalize(self, glyph):
+        ys, xs = np.nonzero(glyph)
+        glyph = glyph[ys.min():ys.max()+1, xs.min():xs.max()+1]
+        return cv2.resize(glyph, self.glyph_size, interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+    def readtext(self, img):
+        if img.ndim == 3: img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        binary = np.where(img > 127, 255, 0).astype(np.uint8)
+        columns = np.append(binary.any(axis=0), False)
+        text, scores, x0 = "", [], None
+        for x, filled in enumerate(columns):
+            if filled and x0 is None: x0 = x
+            elif not filled and x0 is not None:
+                glyph = self._normalize(binary[:, x0:x])
+                diffs = {d: np.abs(glyph - ref).mean() for d, ref in self.glyphs.items()}
+                digit = min(diffs, key=diffs.get)
+                text += digit
+                scores.append(1.0 - diffs[digit])
+                x0 = None
+        if len(text) == 0: return []
+        hh, w = binary.shape
+        return [([[0,0],[w,0],[w,hh],[0,hh]], text, float(np.mean(scores)))]
+
+
+# === Ground-truth screen -> video transform for a given resolution ===
+#   Same layout as `Transformer.transform`: [x, y, 1] @ transform = [video_x, video_y].
+#   VR screen space starts bottom-left, video space starts top-left, hence the flipped y.
+def ground_truth_transform(resolution, vr_screen_size=VR_SCREEN_SIZE, coverage:float=0.8):
+    width, height = resolution
+    cx, cy = vr_screen_size[0]/2, vr_screen_size[1]/2
+    s = coverage * min(width, height) / (2 * 300)   # Keep +-300 VR px of the screen center in view
+    return np.array([[s, 0.0], [0.0, -s], [width/2 - s*cx, height/2 + s*cy]])
+
+# === Bounding box of the frame counter, in the format of `ocr.frame_count_bounding_box()` ===
+def counter_bounding_box(digits:int=6):
+    (w, hh), base = cv2.getTextSize("0"*digits, COUNTER_FONT, COUNTER_SCALE, COUNTER_THICKNESS)
+    return (COUNTER_MARGIN, COUNTER_MARGIN), (COUNTER_MARGIN + w + 4*COUNTER_THICKNESS, COUNTER_MARGIN + hh + base + 4*COUNTER_THICKNESS)
+
+# === Render a single synthetic video frame ===
+def render_frame(resolution, vr_frame:int, anchor=None, anchor_coords=None, cube_coords=None, cube_size:int=30, background=(90,90,90)):
+    width, height = resolution
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = background
+    # Calibration anchor, alpha-blended at its centroid
+    if anchor is not None and anchor_coords is not None:
+        ah, aw = anchor.shape[:2]
+        x1, y1 = int(round(anchor_coords[0] - aw/2)), int(round(anchor_coords[1] - ah/2))
+        if 0 <= x1 and 0 <= y1 and x1+aw <= width and y1+ah <= height:
+            alpha = anchor[:,:,3:4].astype(np.float32) / 255.0
+            region = frame[y1:y1+ah, x1:x1+aw].astype(np.float32)
+            frame[y1:y1+ah, x1:x1+aw] = (alpha*anchor[:,:,:3] + (1-alpha)*region).astype(np.uint8)
+    # Cube, drawn as a filled blue square
+    if cube_coords is not None:
+        half = cube_size // 2
+        cx, cy = int(cube_coords[0]), int(cube_coords[1])
+        cv2.rectangle(frame, (cx-half, cy-half), (cx+half, cy+half), (200,80,20), -1)
+    # Frame counter on a black plate, top-left
+    bbox_min, bbox_max = counter_bounding_box()
+    cv2.rectangle(frame, bbox_min, bbox_max, (0,0,0), -1)
+    (_, hh), _ = cv2.getTextSize(str(vr_frame), COUNTER_FONT, COUNTER_SCALE, COUNTER_THICKNESS)
+    cv2.putText(frame, str(vr_frame), (bbox_min[0]+2*COUNTER_THICKNESS, bbox_min[1]+hh+2*COUNTER_THICKNESS), COUNTER_FONT, COUNTER_SCALE, (255,255,255), COUNTER_THICKNESS)
+    return frame
+
+# === Generate a synthetic recording and its CSVs inside `root_dir` ===
+#   Outputs `<video_filename>`, `calibration.csv`, `<positions_filename>` and `synthetic.json`,
+#   which records the resolution, counter ROI and ground-truth transform.
+#   Example:
+#   manifest = generate_recording('./bench/android', DEVICES['android'], './anchor.png')
+def generate_recording(root_dir:str,
+                       resolution,
+                       anchor_filepath:str,
+                       video_filename:str="recording.mp4",
+                       targets_filename:str="calibration.csv",
+                       positions_filename:str="cube_position.csv",
+                       video_fps:float=30,
+                       vr_fps:float=72,
+                       start_frame:int=6876,
+                       target_duration:float=1.0,
+                       cube_duration:float=5.0,
+                       anchor_size:int=40,
+                       codec:str="mp4v",
+                       verbose:bool=True):
+    # Only ever write into an empty directory or a previous synthetic recording, never over real trials
+    if os.path.isdir(root_dir) and len(os.listdir(root_dir)) > 0:
+        assert os.path.exists(os.path.join(root_dir, 'synthetic.json')), f"'{root_dir}' is not empty and does not hold a synthetic recording; refusing to write into it."
+    h.mkdirs(root_dir, delete_existing=False)
+    transform = ground_truth_transform(resolution)
+    to_video = lambda p: np.dot([p[0], p[1], 1], transform)
+    center = (VR_SCREEN_SIZE[0]/2, VR_SCREEN_SIZE[1]/2)
+    anchor = cv2.resize(cv2.imread(anchor_filepath, cv2.IMREAD_UNCHANGED), (anchor_size, anchor_size), interpolation=cv2.INTER_NEAREST)
+    if anchor.shape[2] == 3: anchor = cv2.cvtColor(anchor, cv2.COLOR_BGR2BGRA)
+
+    # Calibration schedule, in VR frames. Rows mirror those logged by the Unity calibration scene.
+    frames_per_target = int(round(target_duration * vr_fps))
+    targets = []
+    for i, (dx, dy) in enumerate(TARGET_OFFSETS):
+        vr_frame = start_frame + i*frames_per_target
+        sx, sy = center[0]+dx, center[1]+dy
+        targets.append({'unix_ms':0, 'frame':vr_frame, 'timestamp':i*target_duration, 'event':'Target', 'target_number':i,
+                        'world_pos_x':0, 'world_pos_y':0, 'world_pos_z':50,
+                        'left_screen_pos_x':sx, 'left_screen_pos_y':sy, 'left_screen_pos_z':50,
+                        'center_screen_pos_x':sx, 'center_screen_pos_y':sy, 'center_screen_pos_z':50,
+                        'right_screen_pos_x':sx, 'right_screen_pos_y':sy, 'right_screen_pos_z':50})
+    calibration_end = start_frame + len(TARGET_OFFSETS)*frames_per_target
+    cube_end = calibration_end + int(round(cube_duration * vr_fps))
+    boundary = lambda event, frame: dict({k:0 for k in targets[0]}, event=event, frame=frame, target_number=None)
+    pd.DataFrame([boundary('Start', start_frame)] + targets + [boundary('End', calibration_end)]).to_csv(os.path.join(root_dir, targets_filename), index=False)
+
+    # Cube track: a Lissajous curve around the screen center, one row per VR frame
+    positions = []
+    for vr_frame in range(calibration_end, cube_end):
+        t = (vr_frame - calibration_end) / vr_fps
+        sx, sy = center[0] + 250*np.sin(1.3*t), center[1] + 200*np.sin(2.1*t)
+        positions.append({'unix_ms':int(t*1000), 'frame':vr_frame, 'world_pos_x':0, 'world_pos_y':1.25, 'world_pos_z':0.5,
+                          'center_screen_pos_x':sx, 'center_screen_pos_y':sy, 'center_screen_pos_z':0.5,
+                          'left_screen_pos_x':sx, 'left_screen_pos_y':sy, 'left_screen_pos_z':0.5,
+                          'right_screen_pos_x':sx, 'right_screen_pos_y':sy, 'right_screen_pos_z':0.5})
+    pdf = pd.DataFrame(positions).set_index('frame', drop=False)
+    pdf.to_csv(os.path.join(root_dir, positions_filename), index=False)
+
+    # Render the recording. The video runs at its own fps, so VR frames are sampled rather than stepped.
+    out = cv2.VideoWriter(os.path.join(root_dir, video_filename), cv2.VideoWriter_fourcc(*codec), video_fps, resolution)
+    n_frames = int(np.ceil((cube_end - start_frame) / vr_fps * video_fps))
+    for fidx in range(n_frames):
+        vr_frame = start_frame + int(fidx * vr_fps / video_fps)
+        anchor_coords, cube_coords = None, None
+        if vr_frame < calibration_end:
+            row = targets[(vr_frame - start_frame) // frames_per_target]
+            anchor_coords = to_video((row['left_screen_pos_x'], row['left_screen_pos_y']))
+        elif vr_frame in pdf.index:
+            row = pdf.loc[vr_frame]
+            cube_coords = to_video((row['left_screen_pos_x'], row['left_screen_pos_y']))
+        out.write(render_frame(resolution, vr_frame, anchor=anchor, anchor_coords=anchor_coords, cube_coords=cube_coords))
+    out.release()
+
+    # Manifest, so that consumers know the ROI and expected mapping
+    bbox_min, bbox_max = counter_bounding_box()
+    manifest = {
+        'resolution': list(resolution),
+        'video_filename': video_filename,
+        'targets_filename': targets_filename,
+        'positions_filename': positions_filename,
+        'video_fps': video_fps,
+        'vr_fps': vr_fps,
+        'frames': n_frames,
+        'bbox_min': list(bbox_min),
+        'bbox_max': list(bbox_max),
+        'transform': h.to_serializable(transform)
+    }
+    with open(os.path.join(root_dir, 'synthetic.json'), 'w') as outfile:
+        json.dump(manifest, outfile, indent=2)
+    if verbose: print(f"\tSynthetic recording with {n_frames} frames saved in '{root_dir}'")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root_dir', help="Directory to write the synthetic recording into", type=str)
+    parser.add_argument('-d', '--device', help="Recording device, which sets the resolution", type=str, choices=list(DEVICES.keys()), default='android')
+    parser.add_argument('-r', '--resolution', help="Custom resolution as WIDTHxHEIGHT, overrides --device", type=str, default=None)
+    parser.add_argument('-fps', '--video_fps', help="Frame rate of the recording", type=float, default=30)
+    parser.add_argument('-cd', '--cube_duration', help="Seconds of cube movement after calibration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    resolution = tuple(int(v) for v in args.resolution.split('x')) if args.resolution is not None else DEVICES[args.device]
+    generate_recording(args.root_dir, resolution, './anchor.png', video_fps=args.video_fps, cube_duration=args.cube_duration)